@@ -0,0 +1,85 @@
+"""Helpers shared by the DNS client and resolver scripts."""
+import selectors
+import socket
+import threading
+import time
+import dns.message
+
+
+class RateLimiter:
+    """Keeps successive calls to wait() at least `min_interval` seconds apart.
+
+    Only sleeps when calls arrive faster than that; safe to share between
+    threads.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_ok = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_ok - now
+            self._next_ok = max(now, self._next_ok) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Last formatted timestamp, reused while the second has not changed
+_ts_cached = (0, '')
+
+
+def ts_now():
+    """Return the current local time as 'YYYY-MM-DD HH:MM:SS'."""
+    global _ts_cached
+    now = int(time.time())
+    if now != _ts_cached[0]:
+        _ts_cached = (now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+    return _ts_cached[1]
+
+
+def race_servers(qry, servers, timeout=3):
+    """Send `qry` to all `servers` at once and yield replies as they arrive.
+
+    Yields (server, response, rtt_ms) in arrival order until every server
+    has answered or `timeout` seconds have passed since sending.
+    """
+    wire = qry.to_wire()
+    sel = selectors.DefaultSelector()
+    try:
+        start = time.perf_counter()
+        for server in servers:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sel.register(sock, selectors.EVENT_READ, server)
+            try:
+                sock.sendto(wire, (server, 53))
+            except OSError:
+                sel.unregister(sock)
+                sock.close()
+
+        deadline = start + timeout
+        while sel.get_map():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            for key, _ in sel.select(remaining):
+                rtt_ms = (time.perf_counter() - start) * 1000
+                sel.unregister(key.fileobj)
+                try:
+                    data = key.fileobj.recv(65535)
+                    resp = dns.message.from_wire(data)
+                except Exception:
+                    continue
+                finally:
+                    key.fileobj.close()
+                if qry.is_response(resp):
+                    yield key.data, resp, rtt_ms
+    finally:
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        sel.close()
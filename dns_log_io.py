@@ -0,0 +1,187 @@
+"""DNS log parsing and per-domain metrics shared by the plotting scripts.
+
+load_cached() keeps the parsed columns in a pickle next to the log and
+only reparses when the log changes, so running both analyzer_plot.py and
+plot_h1_dns.py parses the log once.
+"""
+import mmap
+import os
+import pickle
+import socket
+import struct
+import numpy as np
+
+
+# Bump whenever parse_dns_log's output changes, so load_cached ignores
+# sidecar pickles written by an older parser
+PARSE_FORMAT_VERSION = 2
+
+# Response column codes; anything else is stored as -1
+RESPONSE_REFERRAL = 0
+RESPONSE_NO_ANSWER = 1
+RESPONSE_FAIL = 2
+RESPONSE_ANSWER = 3
+
+
+def _response_code(resp):
+    """Map a logged Response: value (bytes) to its small integer code."""
+    if resp == b'Referral':
+        return RESPONSE_REFERRAL
+    if resp == b'NO ANSWER':
+        return RESPONSE_NO_ANSWER
+    if resp.startswith(b'FAIL'):
+        return RESPONSE_FAIL
+    if resp.startswith(b'['):
+        return RESPONSE_ANSWER
+    return -1
+
+
+def _server_key(ip, label_ids):
+    """Map a logged server field (bytes) to an integer key.
+
+    IPv4 addresses become their 32-bit value. Other labels such as CACHE
+    or None are interned in `label_ids` and numbered from 2**32 up, so
+    each distinct label still counts as its own server.
+    """
+    try:
+        return struct.unpack('>I', socket.inet_aton(ip.decode('ascii')))[0]
+    except (OSError, UnicodeDecodeError):
+        key = label_ids.get(ip)
+        if key is None:
+            key = label_ids[ip] = (1 << 32) + len(label_ids)
+        return key
+
+
+def parse_dns_log(filepath):
+    """Parse the DNS log file into per-hop columns.
+
+    Returns a dict with keys:
+    - 'domains': domain names in order of first appearance
+    - 'domain_idx': int32 array, index into 'domains' for every hop
+    - 'ips': int64 array of server keys per hop: the 32-bit IPv4 address,
+      or an id above 2**32 for non-address labels such as CACHE
+    - 'rtts': float64 array of RTTs in ms per hop (NaN when missing)
+    - 'responses': int8 array of RESPONSE_* codes per hop
+    """
+    domains = []
+    domain_ids = {}
+    label_ids = {}
+    n = 0
+
+    if os.path.getsize(filepath) == 0:
+        domain_idx = np.empty(0, dtype=np.int32)
+        ips = np.empty(0, dtype=np.int64)
+        rtts = np.empty(0, dtype=np.float64)
+        responses = np.empty(0, dtype=np.int8)
+    else:
+        with open(filepath, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # size the columns from the line count so they are filled in place
+            raw = np.frombuffer(mm, dtype=np.uint8)
+            max_hops = int(np.count_nonzero(raw == 0x0A)) + 1
+            del raw  # release the buffer export before mm is closed
+
+            domain_idx = np.empty(max_hops, dtype=np.int32)
+            ips = np.empty(max_hops, dtype=np.int64)
+            rtts = np.empty(max_hops, dtype=np.float64)
+            responses = np.empty(max_hops, dtype=np.int8)
+
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = mm.find(b'\n', start)
+                if end == -1:
+                    end = size
+                line = mm[start:end]
+                start = end + 1
+
+                # time | domain | mode | ip | Step: .. | Response: .. | RTT: .. | rest
+                parts = line.split(b'|', 7)
+                if len(parts) < 7:
+                    continue
+                step_f = parts[4].strip()
+                resp_f = parts[5].strip()
+                rtt_f = parts[6].strip()
+                if not (step_f.startswith(b'Step:') and resp_f.startswith(b'Response:') and rtt_f.startswith(b'RTT:')):
+                    continue
+                dom = parts[1].strip().decode('utf-8', 'replace')
+                resp = resp_f.removeprefix(b'Response:').strip()
+                rtt_raw = rtt_f.removeprefix(b'RTT:').strip()
+
+                rtt_val = np.nan
+                if rtt_raw and rtt_raw != b'-':
+                    try:
+                        rtt_val = float(rtt_raw.partition(b' ')[0])
+                    except ValueError:
+                        rtt_val = np.nan
+
+                idx = domain_ids.get(dom)
+                if idx is None:
+                    idx = domain_ids[dom] = len(domains)
+                    domains.append(dom)
+                domain_idx[n] = idx
+                ips[n] = _server_key(parts[3].strip(), label_ids)
+                rtts[n] = rtt_val
+                responses[n] = _response_code(resp)
+                n += 1
+
+    return {
+        'domains': domains,
+        'domain_idx': domain_idx[:n],
+        'ips': ips[:n],
+        'rtts': rtts[:n],
+        'responses': responses[:n],
+    }
+
+
+def collect_metrics(log_cols, count=10):
+    """Collect metrics (unique servers and total RTT) for the first `count` domains."""
+    labels = log_cols['domains'][:count]
+    n = len(labels)
+    domain_idx = log_cols['domain_idx']
+    rtts = log_cols['rtts']
+
+    # group hops by domain: stable sort keeps per-domain hop order
+    order = np.argsort(domain_idx, kind='stable')
+    bounds = np.searchsorted(domain_idx[order], np.arange(n + 1))
+    ips_sorted = log_cols['ips'][order]
+
+    has_rtt = ~np.isnan(rtts)
+    sums = np.bincount(domain_idx, weights=np.where(has_rtt, rtts, 0.0), minlength=n)
+    counts = np.bincount(domain_idx[has_rtt], minlength=n)
+
+    out = []
+    for i, dom in enumerate(labels):
+        start, end = bounds[i], bounds[i + 1]
+        servers = np.unique(ips_sorted[start:end]).size
+        total_ms = float(sums[i]) if counts[i] else None
+        out.append({'domain': dom, 'servers_visited': servers, 'total_latency_ms': total_ms, 'rtt_count': int(counts[i])})
+    return out
+
+
+def load_cached(log_path):
+    """Return parse_dns_log(log_path), reusing a sidecar pickle when fresh.
+
+    The cache lives at `<log_path>.cache.pkl` and is keyed on
+    PARSE_FORMAT_VERSION and the log's size and modification time.
+    """
+    cache_path = log_path + '.cache.pkl'
+    st = os.stat(log_path)
+    stamp = (PARSE_FORMAT_VERSION, st.st_size, st.st_mtime_ns)
+
+    try:
+        with open(cache_path, 'rb') as fh:
+            cached = pickle.load(fh)
+        if cached.get('stamp') == stamp:
+            return cached['cols']
+    except (OSError, pickle.PickleError, EOFError, AttributeError):
+        pass
+
+    log_cols = parse_dns_log(log_path)
+    tmp_path = cache_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as fh:
+            pickle.dump({'stamp': stamp, 'cols': log_cols}, fh)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return log_cols
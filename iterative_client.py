@@ -7,14 +7,74 @@ import dns.query
 import dns.name
 import time
 import os
-from datetime import datetime
+import atexit
+import pickle
+
+from dns_common import RateLimiter, race_servers, ts_now
 
 QUERIES_FILE = os.path.join(os.path.dirname(__file__), 'queries2.txt')
 OUTPUT_SUMMARY = os.path.join(os.path.dirname(__file__), 'h2_summary.csv')
 DETAILED_LOG = os.path.join(os.path.dirname(__file__), 'dns_log2.txt')
+CACHE_FILE = os.path.join(os.path.dirname(__file__), 'iter_dns_cache.pkl')
+
+# How long failed lookups are remembered (seconds)
+NEGATIVE_TTL = 15
+
+# Minimum spacing between lookups that go out to the root servers (seconds)
+ROOT_MIN_INTERVAL = 0.05
+
+
+class TTLCache:
+    """Dict-backed cache whose entries expire after a per-entry TTL.
+
+    Expiry is stored as wall-clock time so entries stay valid across runs.
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        val, expiry = entry
+        if time.time() >= expiry:
+            del self._data[key]
+            return None
+        return val
 
-# Simple cache to speed repeated lookups
-_CACHE = {}
+    def set(self, key, val, ttl):
+        self._data[key] = (val, time.time() + ttl)
+
+    def load(self, path):
+        try:
+            with open(path, 'rb') as fh:
+                self._data = pickle.load(fh)
+        except (OSError, pickle.PickleError, EOFError):
+            self._data = {}
+
+    def dump(self, path):
+        now = time.time()
+        live = {k: v for k, v in self._data.items() if v[1] > now}
+        # write a temp file and swap it in, so a crash never leaves a
+        # truncated pickle behind
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as fh:
+                pickle.dump(live, fh)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+# Answers keyed by (qname, qtype); main() loads and saves it across runs
+_CACHE = TTLCache()
+
+# Recently failed lookups, kept in memory only
+_NEG_CACHE = TTLCache()
+
+# Paces uncached lookups; cache hits are never delayed
+_LIMITER = RateLimiter(ROOT_MIN_INTERVAL)
 
 ROOT_SERVERS = [
     '198.41.0.4',
@@ -23,48 +83,76 @@ ROOT_SERVERS = [
 ]
 
 
-def append_log(line: str):
-    with open(DETAILED_LOG, 'a', encoding='utf-8') as f:
-        f.write(line + '\n')
+# Detailed log handle, opened by main() for the whole run; lines are
+# buffered and written once per query
+_LOG_FH = None
+
+
+def append_log(lines):
+    if _LOG_FH is None:
+        with open(DETAILED_LOG, 'a', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in lines)
+        return
+    _LOG_FH.writelines(line + '\n' for line in lines)
+
+
+def _glue_ip(resp):
+    """Return the first A address in the additional section, or None."""
+    for rr in resp.additional:
+        if rr.rdtype == dns.rdatatype.A:
+            return rr[0].address
+    return None
 
 
 def iterative_lookup(domain: str):
-    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    start_total = time.perf_counter()
+    lines = []
+    try:
+        return _iterative_lookup(domain, lines)
+    finally:
+        append_log(lines)
+
+
+def _iterative_lookup(domain: str, lines: list):
+    ts = ts_now()
     mode = 'Iterative'
 
-    if domain in _CACHE:
-        append_log(f"{ts} | {domain} | {mode} | CACHE | Step: Cache | Response: {_CACHE[domain]} | RTT: 0 ms | Total: 0 ms | Cache HIT")
-        return _CACHE[domain], 0.0, 'HIT'
+    cached = _CACHE.get((domain, 'A'))
+    if cached is not None:
+        lines.append(f"{ts} | {domain} | {mode} | CACHE | Step: Cache | Response: {cached} | RTT: 0 ms | Total: 0 ms | Cache HIT")
+        return cached, 0.0, 'HIT'
 
+    if _NEG_CACHE.get((domain, 'A')) is not None:
+        lines.append(f"{ts} | {domain} | {mode} | CACHE | Step: Cache | Response: FAIL (cached) | RTT: 0 ms | Total: 0 ms | Cache HIT")
+        return None, 0.0, 'HIT'
+
+    _LIMITER.wait()
+    start_total = time.perf_counter()
     qname = dns.name.from_text(domain)
     current_ns = ROOT_SERVERS[:]
     accumulated_rtt = 0.0
     answer_ips = None
+    answer_ttl = None
 
-    # Query root servers first
+    # Query all root servers in parallel; first referral with glue wins
     tld_ip = None
-    for root in current_ns:
-        step_start = time.perf_counter()
-        try:
-            qry = dns.message.make_query(qname, dns.rdatatype.A)
-            resp = dns.query.udp(qry, root, timeout=3)
-            step_rtt = (time.perf_counter() - step_start) * 1000
-            accumulated_rtt += step_rtt
-            append_log(f"{ts} | {domain} | {mode} | {root} | Step: Root | Response: Referral | RTT: {step_rtt:.2f} ms | Cache MISS")
-
-            if resp.additional:
-                for rr in resp.additional:
-                    if rr.rdtype == dns.rdatatype.A:
-                        tld_ip = rr.items[0].address
-                        break
-                if tld_ip:
-                    break
-        except Exception as ex:
-            append_log(f"{ts} | {domain} | {mode} | {root} | Step: Root | Response: FAIL ({ex}) | RTT: - | Cache MISS")
-            continue
+    answered = set()
+    qry = dns.message.make_query(qname, dns.rdatatype.A)
+    replies = race_servers(qry, current_ns, timeout=3)
+    for root, resp, step_rtt in replies:
+        answered.add(root)
+        # roots run concurrently, so the stage costs the latest arrival so far
+        accumulated_rtt = step_rtt
+        lines.append(f"{ts} | {domain} | {mode} | {root} | Step: Root | Response: Referral | RTT: {step_rtt:.2f} ms | Cache MISS")
+        tld_ip = _glue_ip(resp)
+        if tld_ip:
+            break
+    replies.close()
 
     if not tld_ip:
+        for root in current_ns:
+            if root not in answered:
+                lines.append(f"{ts} | {domain} | {mode} | {root} | Step: Root | Response: FAIL (timeout) | RTT: - | Cache MISS")
+        _NEG_CACHE.set((domain, 'A'), True, ttl=NEGATIVE_TTL)
         return None, accumulated_rtt, 'MISS'
 
     # Query TLD
@@ -74,16 +162,12 @@ def iterative_lookup(domain: str):
         resp = dns.query.udp(qry, tld_ip, timeout=3)
         step_rtt = (time.perf_counter() - step_start) * 1000
         accumulated_rtt += step_rtt
-        append_log(f"{ts} | {domain} | {mode} | {tld_ip} | Step: TLD | Response: Referral | RTT: {step_rtt:.2f} ms | Cache MISS")
-
-        auth_ip = None
-        if resp.additional:
-            for rr in resp.additional:
-                if rr.rdtype == dns.rdatatype.A:
-                    auth_ip = rr.items[0].address
-                    break
+        lines.append(f"{ts} | {domain} | {mode} | {tld_ip} | Step: TLD | Response: Referral | RTT: {step_rtt:.2f} ms | Cache MISS")
+
+        auth_ip = _glue_ip(resp)
     except Exception as ex:
-        append_log(f"{ts} | {domain} | {mode} | {tld_ip} | Step: TLD | Response: FAIL ({ex}) | RTT: - | Cache MISS")
+        lines.append(f"{ts} | {domain} | {mode} | {tld_ip} | Step: TLD | Response: FAIL ({ex}) | RTT: - | Cache MISS")
+        _NEG_CACHE.set((domain, 'A'), True, ttl=NEGATIVE_TTL)
         return None, accumulated_rtt, 'MISS'
 
     # Query authoritative
@@ -94,30 +178,41 @@ def iterative_lookup(domain: str):
         step_rtt = (time.perf_counter() - step_start) * 1000
         accumulated_rtt += step_rtt
 
-        if resp.answer:
-            answer_ips = [rdata.address for rr in resp.answer for rdata in rr.items if rr.rdtype == dns.rdatatype.A]
-            append_log(f"{ts} | {domain} | {mode} | {auth_ip} | Step: Authoritative | Response: {answer_ips} | RTT: {step_rtt:.2f} ms | Cache MISS")
+        # follow any CNAME chain from qname to the final A RRset
+        chain = resp.resolve_chaining()
+        if chain.answer is not None:
+            answer_ips = [rdata.address for rdata in chain.answer]
+            answer_ttl = chain.minimum_ttl
+            lines.append(f"{ts} | {domain} | {mode} | {auth_ip} | Step: Authoritative | Response: {answer_ips} | RTT: {step_rtt:.2f} ms | Cache MISS")
         else:
-            append_log(f"{ts} | {domain} | {mode} | {auth_ip} | Step: Authoritative | Response: NO ANSWER | RTT: {step_rtt:.2f} ms | Cache MISS")
+            lines.append(f"{ts} | {domain} | {mode} | {auth_ip} | Step: Authoritative | Response: NO ANSWER | RTT: {step_rtt:.2f} ms | Cache MISS")
 
     except Exception as ex:
-        append_log(f"{ts} | {domain} | {mode} | {auth_ip} | Step: Authoritative | Response: FAIL ({ex}) | RTT: - | Cache MISS")
+        lines.append(f"{ts} | {domain} | {mode} | {auth_ip} | Step: Authoritative | Response: FAIL ({ex}) | RTT: - | Cache MISS")
 
     total_ms = (time.perf_counter() - start_total) * 1000
     if answer_ips:
-        _CACHE[domain] = answer_ips
-        append_log(f"{ts} | {domain} | TOTAL | TotalTime: {total_ms:.2f} ms | Cache Stored")
+        _CACHE.set((domain, 'A'), answer_ips, ttl=answer_ttl)
+        lines.append(f"{ts} | {domain} | TOTAL | TotalTime: {total_ms:.2f} ms | Cache Stored")
     else:
-        append_log(f"{ts} | {domain} | TOTAL | TotalTime: {total_ms:.2f} ms | No Response")
+        _NEG_CACHE.set((domain, 'A'), True, ttl=NEGATIVE_TTL)
+        lines.append(f"{ts} | {domain} | TOTAL | TotalTime: {total_ms:.2f} ms | No Response")
 
     return answer_ips, total_ms, 'MISS'
 
 
 def main():
-    if not os.path.exists(QUERIES_FILE := QUERIES_FILE if 'QUERIES_FILE' in globals() else QUERIES_FILE):
+    global _LOG_FH
+
+    if not os.path.exists(QUERIES_FILE):
         print(f"[ERROR] Query file not found: {QUERIES_FILE}")
         return
 
+    _CACHE.load(CACHE_FILE)
+    atexit.register(_CACHE.dump, CACHE_FILE)
+    _LOG_FH = open(DETAILED_LOG, 'a', buffering=1 << 16, encoding='utf-8')
+    atexit.register(_LOG_FH.close)
+
     with open(QUERIES_FILE, 'r', encoding='utf-8') as fh:
         queries = [ln.strip() for ln in fh if ln.strip()]
 
@@ -136,7 +231,6 @@ def main():
         else:
             print(f"[{i}/{total}] {dom} -> FAIL")
             fail += 1
-        time.sleep(0.3)
 
     avg = total_latency / success if success else 0.0
     with open(OUTPUT_SUMMARY, 'a', encoding='utf-8') as out:
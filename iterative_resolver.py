@@ -1,9 +1,16 @@
 """Iterative DNS resolver server
 """
+import io
 import socket
 import time
 import sys
-from dnslib import DNSRecord
+import dns.exception
+import dns.flags
+import dns.message
+import dns.query
+import dns.rdatatype
+
+from dns_common import race_servers, ts_now
 
 
 # Default root servers used for bootstrap
@@ -14,86 +21,161 @@ ROOT_NS = [
 ]
 
 
-def resolve_iteratively(query_bytes):
+def _client_wire(query, resp):
+    """Render `resp` for a UDP reply within the client's payload limit.
+
+    The limit is the client's EDNS payload size, or 512 bytes without
+    EDNS. When the answer does not fit, only the header and question are
+    sent with TC set, so the client retries over TCP.
+    """
+    limit = max(512, query.payload) if query.edns >= 0 else 512
+    try:
+        return resp.to_wire(max_size=limit)
+    except dns.exception.TooBig:
+        truncated = dns.message.make_response(query)
+        truncated.set_rcode(resp.rcode())
+        truncated.flags |= dns.flags.TC
+        return truncated.to_wire(max_size=limit)
+
+
+def resolve_iteratively(query_bytes, sock=None):
     """Perform iterative resolution for one DNS query.
 
+    `sock` is an optional non-blocking UDP socket to reuse; when omitted
+    one is opened for this call and shared with any nested NS-name lookups.
+
     Returns: (response_bytes or None, step_log (list), total_ms, queried_name)
     """
-    query = DNSRecord.parse(query_bytes)
-    qname = str(query.q.qname)
+    own_sock = sock is None
+    if own_sock:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+    try:
+        query = dns.message.from_wire(query_bytes)
+        resp, timeline, total_ms, qname = _resolve_iteratively(query, sock)
+        return (_client_wire(query, resp) if resp is not None else None), timeline, total_ms, qname
+    finally:
+        if own_sock:
+            sock.close()
+
+
+def _a_addresses(resp):
+    """Return every A address in the answer section of `resp` (or [])."""
+    if resp is None:
+        return []
+    return [rd.address for rrset in resp.answer if rrset.rdtype == dns.rdatatype.A for rd in rrset]
+
+
+def _resolve_iteratively(query, sock, start_ns=None, seen=None, resolving=None):
+    """Resolve `query` starting from `start_ns` (root servers by default).
+
+    `seen` maps nameserver names to addresses already resolved for the
+    current client query, so nested lookups do not repeat work.
+    `resolving` holds the names whose lookup is still in progress, which
+    stops NS lookups from looping.
+    """
+    qname = query.question[0].name.to_text()
+    if seen is None:
+        seen = {}
+    if resolving is None:
+        resolving = set()
 
     timeline = []
     start = time.time()
-    current_ns = ROOT_NS[:]
+    current_ns = list(start_ns) if start_ns else ROOT_NS[:]
     response_payload = None
     step_idx = 0
 
     # Continue until we get an answer or cannot proceed
     while True:
         step_idx += 1
-        responded = False
+        resp = None
         used_server = None
-        got_data = None
 
-        for server in current_ns:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                s.settimeout(2)
+        if step_idx == 1:
+            # first stage: ask every server at once and keep the fastest answer
+            replies = race_servers(query, current_ns, timeout=2)
+            used_server, resp, rtt_ms = next(replies, (None, None, None))
+            replies.close()
+            if resp is not None and resp.flags & dns.flags.TC:
+                try:
+                    resp = dns.query.tcp(query, used_server, timeout=2)
+                except Exception:
+                    timeline.append({'step': step_idx, 'server': used_server, 'rtt': None, 'status': 'error'})
+                    break
+            if resp is None:
+                for server in current_ns:
+                    timeline.append({'step': step_idx, 'server': server, 'rtt': None, 'status': 'timeout'})
+        else:
+            for server in current_ns:
                 t0 = time.time()
                 try:
-                    s.sendto(query_bytes, (server, 53))
-                    got_data, _ = s.recvfrom(2048)
-                    t1 = time.time()
-                    rtt_ms = (t1 - t0) * 1000
-                    responded = True
+                    # retries over TCP when the UDP reply is truncated
+                    resp, _ = dns.query.udp_with_fallback(query, server, timeout=2, ignore_unexpected=True, udp_sock=sock)
+                    rtt_ms = (time.time() - t0) * 1000
                     used_server = server
                     break
-                except socket.timeout:
+                except dns.exception.Timeout:
                     timeline.append({'step': step_idx, 'server': server, 'rtt': None, 'status': 'timeout'})
+                except Exception:
+                    timeline.append({'step': step_idx, 'server': server, 'rtt': None, 'status': 'error'})
 
-        if not responded:
+        if resp is None:
             break
 
-        parsed = DNSRecord.parse(got_data)
-
         # classify stage
-        if step_idx == 1:
+        if step_idx == 1 and current_ns == ROOT_NS:
             stage = 'Root'
-        elif parsed.auth and not parsed.rr:
+        elif resp.authority and not resp.answer:
             stage = 'TLD'
         else:
             stage = 'Authoritative'
 
         # summarize response
-        records = parsed.rr or parsed.auth or []
+        records = resp.answer or resp.authority
         summary = []
         if records:
-            for rr in records:
-                summary.append(f"{rr.rname} -> {rr.rtype} -> {rr.rdata}")
+            for rrset in records:
+                for rd in rrset:
+                    summary.append(f"{rrset.name} -> {int(rrset.rdtype)} -> {rd}")
         else:
             summary.append('Referral or empty')
 
         timeline.append({'step': step_idx, 'server': used_server, 'rtt': round(rtt_ms, 2), 'stage': stage, 'response': summary})
 
-        if parsed.rr:
-            response_payload = got_data
+        if resp.answer:
+            response_payload = resp
             break
 
         # attempt to extract IPs for next iteration
-        next_ips = [str(rr.rdata) for rr in parsed.ar if rr.rtype == 1]
+        next_ips = [rd.address for rrset in resp.additional if rrset.rdtype == dns.rdatatype.A for rd in rrset]
         if not next_ips:
-            ns_names = [str(rr.rdata) for rr in parsed.auth if rr.rtype == 2]
+            ns_names = [rd.target.to_text() for rrset in resp.authority if rrset.rdtype == dns.rdatatype.NS for rd in rrset]
             if ns_names:
-                # try resolving nameserver names by recursive call
+                # resolve nameserver names, starting at the servers that sent
+                # this referral and falling back to the root if that fails
                 resolved_ips = []
                 for n in ns_names:
-                    sub_q = DNSRecord.question(n)
-                    sub_resp, sub_log, _, _ = resolve_iteratively(bytes(sub_q.pack()))
-                    timeline.extend(sub_log)
-                    if sub_resp:
-                        p = DNSRecord.parse(sub_resp)
-                        for rr in p.rr:
-                            if rr.rtype == 1:
-                                resolved_ips.append(str(rr.rdata))
+                    if n not in seen and n not in resolving:
+                        resolving.add(n)
+                        try:
+                            sub_q = dns.message.make_query(n, dns.rdatatype.A)
+                            sub_resp, sub_log, _, _ = _resolve_iteratively(
+                                sub_q, sock, start_ns=current_ns, seen=seen, resolving=resolving)
+                            timeline.extend(sub_log)
+                            ips = _a_addresses(sub_resp)
+                            if not ips:
+                                sub_resp, sub_log, _, _ = _resolve_iteratively(
+                                    sub_q, sock, seen=seen, resolving=resolving)
+                                timeline.extend(sub_log)
+                                ips = _a_addresses(sub_resp)
+                            if ips:
+                                seen[n] = ips
+                        finally:
+                            resolving.discard(n)
+                    resolved_ips.extend(seen.get(n, []))
+                    if resolved_ips:
+                        break
                 next_ips = resolved_ips
 
         if not next_ips:
@@ -113,7 +195,7 @@ def run_server(logfile='resolver_log.txt'):
             print(*args, **kwargs, file=out)
             out.flush()
 
-        header = f"\n===== New Run at {time.strftime('%Y-%m-%d %H:%M:%S')} =====\n"
+        header = f"\n===== New Run at {ts_now()} =====\n"
         out.write(header)
         print(header.strip())
 
@@ -124,23 +206,26 @@ def run_server(logfile='resolver_log.txt'):
         while True:
             try:
                 data, addr = sock.recvfrom(512)
-                recv_ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+                recv_ts = ts_now()
                 resp, log, total, qname = resolve_iteratively(data)
 
-                log_write(f"\n[{recv_ts}] Query from {addr[0]} for {qname}")
+                # build the whole query report, then emit it in one write
+                buf = io.StringIO()
+                buf.write(f"\n[{recv_ts}] Query from {addr[0]} for {qname}\n")
                 for s in log:
-                    log_write(f"  Step {s.get('step')} | Server: {s.get('server')} | Stage: {s.get('stage', 'N/A')} | RTT: {s.get('rtt')} ms")
-                    log_write('    Response:')
+                    buf.write(f"  Step {s.get('step')} | Server: {s.get('server')} | Stage: {s.get('stage', 'N/A')} | RTT: {s.get('rtt')} ms\n")
+                    buf.write('    Response:\n')
                     for L in s.get('response', []):
-                        log_write(f"      {L}")
-                    log_write()
+                        buf.write(f"      {L}\n")
+                    buf.write('\n')
 
-                log_write(f"  Total resolution time: {total} ms")
+                buf.write(f"  Total resolution time: {total} ms\n")
 
                 if resp:
                     sock.sendto(resp, addr)
                 else:
-                    log_write('  Resolution failed.')
+                    buf.write('  Resolution failed.\n')
+                log_write(buf.getvalue(), end='')
 
             except KeyboardInterrupt:
                 log_write('\nShutting down resolver...')
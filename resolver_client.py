@@ -1,24 +1,59 @@
 """Simple DNS client runner
 """
 import dns.resolver
+import ipaddress
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dns_common import RateLimiter
 
 QUERY_LIST_FILE = os.path.join(os.path.dirname(__file__), 'queries2.txt')
 RESULTS_CSV = os.path.join(os.path.dirname(__file__), 'h1_client_results.csv')
 
+# Number of queries kept in flight at once
+MAX_WORKERS = 64
+
+# Minimum spacing between queries sent to a non-local upstream (seconds)
+REMOTE_MIN_INTERVAL = 0.05
+
+# One configured Resolver per worker thread, built on first use
+_tls = threading.local()
+
+
+def _upstream_is_local():
+    """True when every configured nameserver has a private or loopback address."""
+    try:
+        servers = dns.resolver.Resolver().nameservers
+        return bool(servers) and all(ipaddress.ip_address(str(ns)).is_private for ns in servers)
+    except Exception:
+        return False
+
+
+# No throttling when talking to our own resolver (e.g. 10.0.0.5)
+_LIMITER = RateLimiter(0.0 if _upstream_is_local() else REMOTE_MIN_INTERVAL)
+
+
+def _get_resolver():
+    resolver = getattr(_tls, 'resolver', None)
+    if resolver is None:
+        resolver = _tls.resolver = dns.resolver.Resolver()
+        resolver.timeout = 3
+        resolver.lifetime = 3
+    return resolver
+
 
 def do_resolve(name):
     """Resolve a domain name to A records and measure latency (ms).
 
     Returns (list_of_ips or None, elapsed_ms or None)
     """
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = 3
-    resolver.lifetime = 3
     try:
+        resolver = _get_resolver()
+        _LIMITER.wait()
         t0 = time.perf_counter()
-        ans = resolver.resolve(name, 'A')
+        ans = resolver.resolve(name, 'A', raise_on_no_answer=False, search=False)
         elapsed = (time.perf_counter() - t0) * 1000
         ips = [rr.address for rr in ans]
         return ips, elapsed
@@ -41,16 +76,18 @@ def main():
     fail = 0
     sum_latency = 0.0
 
-    for i, dom in enumerate(domains, start=1):
-        ips, ms = do_resolve(dom)
-        if ips:
-            print(f"[{i}/{total}] {dom} -> {', '.join(ips)} ({ms:.1f} ms)")
-            succ += 1
-            sum_latency += ms
-        else:
-            print(f"[{i}/{total}] {dom} -> FAIL")
-            fail += 1
-        time.sleep(0.3)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(do_resolve, dom): (i, dom) for i, dom in enumerate(domains, start=1)}
+        for fut in as_completed(futures):
+            i, dom = futures[fut]
+            ips, ms = fut.result()
+            if ips:
+                print(f"[{i}/{total}] {dom} -> {', '.join(ips)} ({ms:.1f} ms)")
+                succ += 1
+                sum_latency += ms
+            else:
+                print(f"[{i}/{total}] {dom} -> FAIL")
+                fail += 1
 
     avg = sum_latency / succ if succ else 0.0
 
@@ -0,0 +1,28 @@
+import dns_log_io
+from dns_log_io import collect_metrics, parse_dns_log
+
+
+def test_non_address_labels_count_as_distinct_servers(tmp_path):
+    log = tmp_path / 'dns_log.txt'
+    log.write_text(
+        "2025-10-28 08:52:48 | noglue.com | Iterative | 198.41.0.4 | Step: Root | Response: Referral | RTT: 10.00 ms | Cache MISS\n"
+        "2025-10-28 08:52:48 | noglue.com | Iterative | 192.5.6.30 | Step: TLD | Response: Referral | RTT: 20.00 ms | Cache MISS\n"
+        "2025-10-28 08:52:48 | noglue.com | Iterative | None | Step: Authoritative | Response: FAIL (timeout) | RTT: - | Cache MISS\n"
+        "2025-10-28 08:52:49 | noglue.com | Iterative | CACHE | Step: Cache | Response: FAIL (cached) | RTT: 0 ms | Total: 0 ms | Cache HIT\n"
+    )
+
+    metrics = collect_metrics(parse_dns_log(str(log)))
+
+    assert metrics == [{'domain': 'noglue.com', 'servers_visited': 4, 'total_latency_ms': 30.0, 'rtt_count': 3}]
+
+
+def test_load_cached_ignores_pickle_from_older_format(tmp_path, monkeypatch):
+    log = tmp_path / 'dns_log.txt'
+    log.write_text("2025-10-28 08:52:48 | a.com | Iterative | CACHE | Step: Cache | Response: [] | RTT: 0 ms | Cache HIT\n")
+    monkeypatch.setattr(dns_log_io, 'PARSE_FORMAT_VERSION', 1)
+    dns_log_io.load_cached(str(log))
+
+    monkeypatch.setattr(dns_log_io, 'PARSE_FORMAT_VERSION', 2)
+    monkeypatch.setattr(dns_log_io, 'parse_dns_log', lambda path: 'reparsed')
+
+    assert dns_log_io.load_cached(str(log)) == 'reparsed'